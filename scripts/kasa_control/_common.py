@@ -0,0 +1,443 @@
+import asyncio
+from kasa import Discover, SmartDevice, SmartPlug
+import io
+import logging
+import logging.handlers
+import queue
+import argparse
+from typing import Dict, List, Optional, Tuple
+import traceback
+from math import ceil
+from dataclasses import dataclass
+import atexit
+import json
+import os
+
+BLINK_DELAY_SECS = 5
+LOG_BUFFER_SIZE = 65536
+LOG_MAX_BYTES = 1 << 20
+LOG_BACKUP_COUNT = 3
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+DISCOVERY_TARGET = "255.255.255.255"
+DISCOVERY_PACKETS = 3
+DISCOVERY_TIMEOUT_SECS = 3
+CACHED_HOST_TIMEOUT_SECS = 1
+CACHE_PATH = os.path.expanduser("~/.cache/kasa_control.json")
+
+logger = logging.getLogger("kasa_control")
+
+@dataclass
+class PlugState:
+    plug: SmartDevice
+    state: bool
+
+
+def device_kind(is_strip: bool) -> str:
+    return "strip" if is_strip else "plug"
+
+def is_kind(device: SmartDevice, is_strip: bool) -> bool:
+    return device.is_strip if is_strip else isinstance(device, SmartPlug)
+
+def cache_key(alias: str, is_strip: bool) -> str:
+    # Strips and plugs may share an alias, so cache entries are kept apart by kind
+    return f"{device_kind(is_strip)}:{alias}"
+
+def load_host_cache(cache_path: str) -> Dict[str, str]:
+    '''
+    Loads the {cache_key: host} mapping saved by a previous discovery.
+
+    Returns:
+        Dict of cache_key to host, empty if no usable cache exists
+    '''
+    try:
+        with open(cache_path) as cache_file:
+            return json.load(cache_file)
+    except (IOError, OSError, ValueError):
+        return {}
+
+def save_host_cache(cache_path: str, host_cache: Dict[str, str]) -> None:
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as cache_file:
+            json.dump(host_cache, cache_file)
+    except (IOError, OSError) as e:
+        logger.error("ERROR -- Could not write host cache: %s, e: %s", cache_path, e)
+
+async def discover_alias(target_alias: str, is_strip: bool) -> Optional[SmartDevice]:
+    '''
+    async function.  Broadcasts discovery and returns as soon as a strip or plug
+    answering with target_alias is seen instead of waiting out the whole discovery timeout.
+
+    Returns:
+        SmartDevice of the requested kind with matching alias, else None
+    '''
+    matched = asyncio.get_running_loop().create_future()
+
+    async def on_discovered(device: SmartDevice) -> None:
+        logger.info("Found device: alias=%s, model=%s, is_strip=%s", device.alias, device.model, device.is_strip)
+        if device.alias == target_alias and is_kind(device, is_strip) and not matched.done():
+            matched.set_result(device)
+
+    discover_task = asyncio.create_task(Discover.discover(
+        target=DISCOVERY_TARGET,
+        discovery_packets=DISCOVERY_PACKETS,
+        discovery_timeout=DISCOVERY_TIMEOUT_SECS,
+        on_discovered=on_discovered))
+    try:
+        await asyncio.wait({discover_task, matched}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        discover_task.cancel()
+    if matched.done():
+        return matched.result()
+    for device in discover_task.result().values():
+        if device.alias == target_alias and is_kind(device, is_strip):
+            return device
+    return None
+
+async def probe_host(host: str) -> SmartDevice:
+    device = await Discover.discover_single(host)
+    await device.update()
+    return device
+
+async def find_cached(target_alias: str, is_strip: bool, host_cache: Dict[str, str]) -> Optional[SmartDevice]:
+    '''
+    async function.  Probes the cached host for target_alias, if there is one.
+
+    Returns:
+        updated SmartDevice if the cached host still answers as target_alias, else None
+    '''
+    kind = device_kind(is_strip)
+    host = host_cache.get(cache_key(target_alias, is_strip))
+    if host is None:
+        return None
+    try:
+        # A stale host must fail fast rather than wait out kasa's default timeouts
+        device = await asyncio.wait_for(probe_host(host), CACHED_HOST_TIMEOUT_SECS)
+        if is_kind(device, is_strip) and device.alias == target_alias:
+            logger.info("%s: %s is FOUND at cached host: %s", kind, target_alias, host)
+            return device
+    except Exception as e:
+        logger.info("cached host: %s for %s: %s failed, e: %s", host, kind, target_alias, e)
+    return None
+
+async def init(target_alias: str, is_strip: bool) -> Optional[SmartDevice]:
+    '''
+    async function.  Uses kasa library to find the strip or plug matching target_alias.
+    A cached host is tried first, falling back to broadcast discovery on a miss.
+
+    Returns:
+        SmartDevice if found, else None
+    '''
+    kind = device_kind(is_strip)
+    device = await find_cached(target_alias, is_strip, load_host_cache(CACHE_PATH))
+    if device is not None:
+        return device
+    device = await discover_alias(target_alias, is_strip)
+    if device is not None:
+        await device.update()
+        if is_kind(device, is_strip):
+            logger.info("%s: %s is FOUND", kind, target_alias)
+            # Re-read so concurrent lookups sharing the event loop don't drop each other's entries
+            host_cache = load_host_cache(CACHE_PATH)
+            host_cache[cache_key(target_alias, is_strip)] = device.host
+            save_host_cache(CACHE_PATH, host_cache)
+            return device
+    logger.error("ERROR, unable to find %s: %s", kind, target_alias)
+    return None
+
+async def turn_on(device: SmartDevice) -> None:
+    if device.is_strip:
+        await asyncio.gather(*(plug.turn_on() for plug in device.children))
+    else:
+        await device.turn_on()
+    await device.update()
+
+async def turn_off(device: SmartDevice) -> None:
+    if device.is_strip:
+        await asyncio.gather(*(plug.turn_off() for plug in device.children))
+    else:
+        await device.turn_off()
+    await device.update()
+
+def gather_state(device: SmartDevice) -> List[PlugState]:
+    # State is still fresh from the update() done by init()
+    if device.is_strip:
+        return [PlugState(plug, plug.is_on) for plug in device.children]
+    return [PlugState(device, device.is_on)]
+
+async def restore_state_one(plug_state: PlugState) -> None:
+    if plug_state.state:
+        await plug_state.plug.turn_on()
+    else:
+        await plug_state.plug.turn_off()
+
+async def restore_state(device: SmartDevice, gathered_state: List[PlugState]) -> None:
+    await asyncio.gather(*(restore_state_one(plug_state) for plug_state in gathered_state))
+    await device.update()
+
+async def blink(device: SmartDevice, duration_minutes: int) -> None:
+    toggle_count = max(0, ceil(duration_minutes * 60 / BLINK_DELAY_SECS))
+    if toggle_count == 0:
+        return
+    # The update in init() opened the device connection, which kasa's protocol keeps
+    # alive and reuses for every toggle below (strip outlets share the strip's protocol)
+    save_state = gather_state(device)
+    # Sleep to absolute deadlines on the monotonic loop clock so toggle latency doesn't accumulate
+    # Bind hot-loop callables to locals to skip global/attribute lookups per toggle
+    now = asyncio.get_running_loop().time
+    sleep = asyncio.sleep
+    on = turn_on
+    off = turn_off
+    delay = BLINK_DELAY_SECS
+    next_tick = now()
+    for i in range(toggle_count):
+        if i & 1 == 0:
+            await on(device)
+        else:
+            await off(device)
+        next_tick += delay
+        await sleep(max(0, next_tick - now()))
+    await restore_state(device, save_state)
+
+async def switch_device(device: SmartDevice, switch_on: bool, blink_minutes: Optional[int]) -> None:
+    if blink_minutes is not None:
+        await blink(device, blink_minutes)
+    elif switch_on:
+        await turn_on(device)
+    else:
+        await turn_off(device)
+
+async def control(target_alias: str, switch_on: bool, blink_minutes: Optional[int], is_strip: bool) -> bool:
+    '''
+    async function.  Finds the strip or plug named target_alias and switches or blinks it.
+
+    Returns:
+        True on success
+    '''
+    try:
+        device = await init(target_alias, is_strip)
+        if device is None:
+            return False
+        await switch_device(device, switch_on, blink_minutes)
+    except Exception as e:
+        logger.error("control error: %s", e)
+        logger.error(traceback.format_exc())
+        return False
+    return True
+
+def parse_targets(targets: str) -> List[Tuple[str, bool, Optional[int]]]:
+    '''
+    Parses a --targets value such as 'Name1=on,Name2=off,Name3=blink:10'.
+    As with the single device switch, any action other than 'on' or 'blink:N' means off.
+
+    Returns:
+        list of (alias, switch_on, blink_minutes) tuples
+    '''
+    parsed = []
+    for target in targets.split(','):
+        alias, _, action = target.strip().rpartition('=')
+        if not alias:
+            raise ValueError(f"target must be alias=action: {target}")
+        action = action.lower()
+        blink_minutes = None
+        if action.startswith('blink:'):
+            blink_minutes = int(action[len('blink:'):])
+        parsed.append((alias, action == 'on', blink_minutes))
+    return parsed
+
+async def batch_one(device: Optional[SmartDevice], target_alias: str, switch_on: bool,
+                    blink_minutes: Optional[int], is_strip: bool, needs_update: bool) -> bool:
+    try:
+        if device is None:
+            logger.error("ERROR, unable to find %s: %s", device_kind(is_strip), target_alias)
+            return False
+        if needs_update:
+            await device.update()
+        await switch_device(device, switch_on, blink_minutes)
+    except Exception as e:
+        logger.error("batch error for %s: %s, e: %s", device_kind(is_strip), target_alias, e)
+        logger.error(traceback.format_exc())
+        return False
+    return True
+
+async def batch_results(targets: List[Tuple[str, bool, Optional[int]]], is_strip: bool) -> List[bool]:
+    '''
+    async function.  Switches every target, running the per-device actions concurrently.
+    Cached hosts are probed first and a single discovery broadcast covers the rest.
+
+    Returns:
+        list of results, one per target
+    '''
+    if not targets:
+        return []
+    aliases = list(dict.fromkeys(target_alias for target_alias, _, _ in targets))
+    host_cache = load_host_cache(CACHE_PATH)
+    cached = await asyncio.gather(*(find_cached(target_alias, is_strip, host_cache) for target_alias in aliases))
+    by_alias = {target_alias: device for target_alias, device in zip(aliases, cached) if device is not None}
+    from_cache = set(by_alias)
+    missing = [target_alias for target_alias in aliases if target_alias not in by_alias]
+    if missing:
+        try:
+            found = await Discover.discover(
+                target=DISCOVERY_TARGET,
+                discovery_packets=DISCOVERY_PACKETS,
+                discovery_timeout=DISCOVERY_TIMEOUT_SECS)
+        except Exception as e:
+            logger.error("batch discovery error: %s", e)
+            logger.error(traceback.format_exc())
+            found = {}
+        # Index only devices of the requested kind so another kind sharing an alias can't hide them
+        for device in found.values():
+            if device.alias in missing and is_kind(device, is_strip):
+                by_alias[device.alias] = device
+        host_cache = load_host_cache(CACHE_PATH)
+        for target_alias in missing:
+            if target_alias in by_alias:
+                host_cache[cache_key(target_alias, is_strip)] = by_alias[target_alias].host
+        save_host_cache(CACHE_PATH, host_cache)
+    return list(await asyncio.gather(*(batch_one(by_alias.get(target_alias), target_alias, switch_on, blink_minutes,
+                                                 is_strip, target_alias not in from_cache)
+                                       for target_alias, switch_on, blink_minutes in targets)))
+
+async def main_batch(targets: List[Tuple[str, bool, Optional[int]]], is_strip: bool) -> bool:
+    '''
+    async function.  Runs batch_results for the --targets command line option.
+
+    Returns:
+        True if every target was found and switched
+    '''
+    return all(await batch_results(targets, is_strip))
+
+def run_many(target_aliases: List[str], switches: List[bool], is_strip: bool, log_file: str) -> List[bool]:
+    '''
+    Switches several strips or plugs concurrently on a single event loop, using cached
+    hosts where possible and at most one discovery broadcast, for callers importing the scripts rather than running them
+    from the command line.
+
+    Returns:
+        list of results, one per target
+    '''
+    if len(target_aliases) != len(switches):
+        raise ValueError(f"got {len(target_aliases)} targets but {len(switches)} switches")
+    if not target_aliases:
+        return []
+    if not logger.handlers:
+        init_logging(log_file)
+    targets = [(target_alias, switch_on, None) for target_alias, switch_on in zip(target_aliases, switches)]
+    return asyncio.run(batch_results(targets, is_strip))
+
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    '''
+    RotatingFileHandler that writes through a LOG_BUFFER_SIZE buffer.  Records are not
+    flushed one by one; the buffer is flushed when full, on rollover and on close().
+    The file size is tracked in memory since seek/tell on the stream would force a flush.
+    '''
+    def _open(self):
+        try:
+            self.bytes_written = os.path.getsize(self.baseFilename) if 'a' in self.mode else 0
+        except OSError:
+            self.bytes_written = 0
+        self.pending_bytes = 0
+        stream = io.TextIOWrapper(open(self.baseFilename, self.mode + 'b', buffering=LOG_BUFFER_SIZE),
+                                  encoding=self.encoding, errors=self.errors, write_through=False)
+        # Same guard as RotatingFileHandler: never rotate e.g. /dev/null.  Checked once per
+        # open rather than per record since the file type can't change while it is open.
+        self.is_regular_file = os.path.isfile(self.baseFilename)
+        return stream
+
+    def flush(self) -> None:
+        pass
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.maxBytes <= 0:
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        if not self.is_regular_file:
+            return False
+        record_bytes = len((self.format(record) + self.terminator).encode(self.encoding or 'utf-8'))
+        if self.bytes_written > 0 and self.bytes_written + record_bytes >= self.maxBytes:
+            self.pending_bytes = record_bytes
+            return True
+        self.bytes_written += record_bytes
+        return False
+
+    def doRollover(self) -> None:
+        pending_bytes = getattr(self, 'pending_bytes', 0)
+        super().doRollover()
+        # The record that triggered the rollover goes to the new file
+        self.bytes_written = getattr(self, 'bytes_written', 0) + pending_bytes
+        self.pending_bytes = 0
+
+def setup_logging_handlers(log_file: str) -> list:
+    try:
+        logging_file_handler = BufferedRotatingFileHandler(log_file, mode='a', maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    except Exception as e:
+        print(f'ERROR -- Could not create logging file: {log_file}, e: {str(e)}')
+        return [logging.StreamHandler()]
+    return [logging_file_handler, logging.StreamHandler()]
+
+def init_logging(log_file: str) -> logging.Logger:
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter(LOG_FORMAT, datefmt="%Y-%m-%d %H:%M:%S")
+    logging_handlers = setup_logging_handlers(log_file)
+    for handler in logging_handlers:
+        handler.setFormatter(formatter)
+    # Real handlers run on the listener thread so file/tty writes never block the event loop
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *logging_handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return logger
+
+def init_argparse(description: str, name_arg: str, name_help: str) -> argparse.ArgumentParser:
+    '''
+    Initializes ArgumentParser for command line args when the script
+    is used in that manner.
+
+    Returns:
+        argparse.ArgumentParser: initialized argparse
+    '''
+    parser = argparse.ArgumentParser(
+        usage='%(prog)s [OPTIONS]',
+        description=description
+    )
+    parser.add_argument('name', nargs='?', metavar=name_arg, help=name_help)
+    parser.add_argument('switch', nargs='?', help="State to set: 'on' or 'off'")
+    parser.add_argument('-t', '--targets', help="Switch several devices with one discovery, e.g. 'Name1=on,Name2=off,Name3=blink:10'")
+    parser.add_argument('-b', '--blink_mode', type=int, default=None, help='Blink for specified number of minutes')
+    return parser
+
+def main(is_strip: bool, log_file: str, description: str, name_arg: str, name_help: str) -> None:
+    '''
+    Command line entry point shared by strip_control.py and plug_control.py.
+    '''
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    kind = device_kind(is_strip)
+    parser = init_argparse(description, name_arg, name_help)
+    args = parser.parse_args()
+    if args.targets is not None:
+        if args.name is not None or args.switch is not None or args.blink_mode is not None:
+            parser.error(f"--targets cannot be combined with {name_arg}, switch or --blink_mode")
+        try:
+            targets = parse_targets(args.targets)
+        except ValueError as e:
+            parser.error(str(e))
+        init_logging(log_file)
+        logger.info('>>>>> START %ss: %s <<<<<', kind, args.targets)
+        success = asyncio.run(main_batch(targets, is_strip))
+        logger.info('>>>>> FINI %ss: %s, status: %s <<<<<', kind, args.targets, success)
+        return
+    if args.name is None or args.switch is None:
+        parser.error(f"{name_arg} and switch are required unless --targets is given")
+    switch_on = (args.switch.lower() == "on")
+    init_logging(log_file)
+
+    logger.info('>>>>> START %s: %s Switch ON: %s, Blink minutes: %s <<<<<', kind, args.name, switch_on, args.blink_mode)
+    success = asyncio.run(control(args.name, switch_on, args.blink_mode, is_strip))
+    logger.info('>>>>> FINI %s: %s, status: %s <<<<<', kind, args.name, success)